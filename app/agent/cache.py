@@ -0,0 +1,115 @@
+"""Small in-process caches shared by the agent tools."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+
+ValueT = TypeVar("ValueT")
+
+
+class TTLCache(Generic[ValueT]):
+    """Bounded LRU mapping whose entries expire after ``ttl`` seconds.
+
+    Cached values are shared between callers and must be treated as read-only.
+    ``get_or_load`` additionally coalesces concurrent misses for the same key so
+    only one caller runs the loader while the others await its result. If the
+    loading caller is cancelled, the waiters retry the load themselves.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        self._entries: OrderedDict[Hashable, Tuple[float, ValueT]] = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future[ValueT]] = {}
+
+    def get(self, key: Hashable) -> Optional[ValueT]:
+        """Return the cached value for ``key`` or ``None`` when missing/expired."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._timer():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: ValueT) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entry."""
+
+        self._entries[key] = (self._timer() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[ValueT]]
+    ) -> ValueT:
+        """Return the cached value for ``key``, loading it once on a miss."""
+
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only the loading caller was cancelled; take over the load
+                # unless this waiter is being cancelled as well.
+                task = asyncio.current_task()
+                if not pending.cancelled() or (task is not None and task.cancelling()):
+                    raise
+
+        future: asyncio.Future[ValueT] = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await loader()
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                # Mark the exception as retrieved when nobody else is waiting.
+                future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._pending[key]
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+__all__ = ["TTLCache"]
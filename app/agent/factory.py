@@ -33,7 +33,12 @@ def get_agent() -> Agent[AgentDependencies, AgentReply]:
             base_url=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY")
         ),
         settings=OpenAIChatModelSettings(
-            temperature=0.1, parallel_tool_calls=True, openai_service_tier="priority"
+            temperature=0.1,
+            parallel_tool_calls=True,
+            openai_service_tier="priority",
+            # The instructions and tool schemas form a fixed prefix; a stable
+            # cache key routes every request to the same provider prompt cache.
+            extra_body={"prompt_cache_key": "shopping-assistant"},
         ),
     )
 
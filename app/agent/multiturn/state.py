@@ -2,51 +2,63 @@
 
 from __future__ import annotations
 
-import asyncio
-from functools import lru_cache
-from typing import Dict
+from typing import Any, Dict
+
+from pydantic import TypeAdapter
 
 from .schemas import TurnState
 
+# Reused across calls so pydantic-core's compiled schema is resolved once.
+_TURN_STATE_ADAPTER: TypeAdapter[TurnState] = TypeAdapter(TurnState)
+
 
 class TurnStateStore:
-    """Thread-safe in-memory map from chat identifiers to turn state."""
+    """In-memory map from chat identifiers to turn state.
+
+    Every operation is a single dictionary access with no ``await`` in between,
+    so it completes atomically on the event loop and needs no lock; concurrent
+    turns for different chats never wait on each other.
+    """
 
     def __init__(self) -> None:
-        self._states: Dict[str, TurnState] = {}
-        self._lock = asyncio.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
 
     async def get(self, chat_id: str) -> TurnState | None:
-        """Return a deep copy of the stored state for the chat, if any."""
+        """Return a fresh state rebuilt from the stored snapshot, if any."""
 
-        async with self._lock:
-            state = self._states.get(chat_id)
-            return state.model_copy(deep=True) if state is not None else None
+        snapshot = self._states.get(chat_id)
+        if snapshot is None:
+            return None
+        return _TURN_STATE_ADAPTER.validate_python(snapshot)
 
     async def set(self, chat_id: str, state: TurnState) -> None:
-        """Persist the provided state for subsequent turns."""
+        """Persist a snapshot of the provided state for subsequent turns.
 
-        async with self._lock:
-            self._states[chat_id] = state.model_copy(deep=True)
+        States are stored as plain dumps rather than deep copies: pydantic-core
+        serialises and revalidates them far faster than ``copy.deepcopy`` walks
+        the nested models, and callers can never mutate the stored snapshot.
+        """
+
+        self._states[chat_id] = _TURN_STATE_ADAPTER.dump_python(state)
 
     async def discard(self, chat_id: str) -> None:
         """Remove any stored state for the chat identifier."""
 
-        async with self._lock:
-            self._states.pop(chat_id, None)
+        self._states.pop(chat_id, None)
 
     async def reset(self) -> None:
         """Clear all stored state (useful for testing)."""
 
-        async with self._lock:
-            self._states.clear()
+        self._states = {}
+
+
+_STORE = TurnStateStore()
 
 
-@lru_cache(maxsize=1)
 def get_turn_state_store() -> TurnStateStore:
     """Return the process-wide store used to persist turn state."""
 
-    return TurnStateStore()
+    return _STORE
 
 
 __all__ = ["TurnStateStore", "get_turn_state_store"]
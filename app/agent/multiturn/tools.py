@@ -2,13 +2,18 @@
 
 from __future__ import annotations
 
-import json
-from typing import List, Optional, Tuple
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
 
 from pydantic_ai.tools import RunContext, Tool
 from sqlalchemy import Boolean, Float, Integer, Text, bindparam, text
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql.elements import TextClause
 
+from ...config import settings
+from ..cache import TTLCache
 from ..dependencies import AgentDependencies
 from .schemas import (
     SearchCandidate,
@@ -17,6 +22,677 @@ from .schemas import (
 )
 
 
+# ``filtered`` feeds scoring, the price bounds and the distribution buckets,
+# and ``price_bounds`` is cross joined into every banded row; both are
+# MATERIALIZED so the member join and the MIN/MAX each run exactly once.
+_SEARCH_MEMBERS_SQL = """
+    WITH city_candidate AS (
+        SELECT id
+        FROM cities
+        WHERE :city_name_query IS NOT NULL
+          AND LOWER(name) = LOWER(:city_name_query)
+        LIMIT 1
+    ),
+{query_ctes}    filtered AS MATERIALIZED (
+        SELECT
+            m.random_key AS member_random_key,
+            m.base_random_key,
+            bp.persian_name AS base_name,
+            COALESCE(br.title, 'بدون برند') AS brand_name,
+            bp.brand_id,
+            bp.category_id,
+            m.price,
+            s.id AS shop_id,
+            s.score AS shop_score,
+            s.city_id,
+            city.name AS city_name,
+            s.has_warranty
+        FROM members AS m
+        JOIN base_products AS bp ON bp.random_key = m.base_random_key
+        LEFT JOIN brands AS br ON br.id = bp.brand_id
+        JOIN shops AS s ON s.id = m.shop_id
+        LEFT JOIN cities AS city ON city.id = s.city_id
+{hard_filters}    ),
+{ranking_ctes}{aggregate}{top_k}    """
+
+_DISTRIBUTION_ROWS = """\
+    price_bounds AS MATERIALIZED (
+        SELECT MIN(price) AS min_price, MAX(price) AS max_price FROM filtered
+    ),
+    banded AS (
+        SELECT
+            f.brand_id,
+            f.city_id,
+            f.has_warranty,
+            f.price,
+            CASE
+                WHEN bounds.max_price = bounds.min_price THEN 1
+                ELSE width_bucket(f.price, bounds.min_price, bounds.max_price, 4)
+            END AS price_bucket
+        FROM filtered AS f
+        CROSS JOIN price_bounds AS bounds
+    )
+    SELECT
+        GROUPING(brand_id, city_id, has_warranty, price_bucket) AS grouping_mask,
+        brand_id,
+        city_id,
+        has_warranty,
+        price_bucket,
+        COUNT(*) AS freq,
+        MIN(price) AS min_price,
+        MAX(price) AS max_price,
+        NULL AS member_random_key,
+        NULL AS base_name,
+        NULL AS brand_name,
+        NULL AS price,
+        NULL AS shop_id,
+        NULL AS shop_score,
+        NULL AS city_name,
+        NULL AS relevance
+    FROM banded
+    GROUP BY GROUPING SETS ((brand_id), (city_id), (has_warranty), (price_bucket), ())
+"""
+
+# Without distributions only the total row is produced, in the same columns.
+_TOTAL_ROW = """\
+    totals AS (
+        SELECT COUNT(*) AS freq, MIN(price) AS min_price, MAX(price) AS max_price
+        FROM filtered
+    )
+    SELECT
+        {total_mask} AS grouping_mask,
+        NULL AS brand_id,
+        NULL AS city_id,
+        NULL AS has_warranty,
+        NULL AS price_bucket,
+        freq,
+        min_price,
+        max_price,
+        NULL AS member_random_key,
+        NULL AS base_name,
+        NULL AS brand_name,
+        NULL AS price,
+        NULL AS shop_id,
+        NULL AS shop_score,
+        NULL AS city_name,
+        NULL AS relevance
+    FROM totals
+"""
+
+# The trigram arm is tested per token, mirroring the per-token similarity in
+# the relevance score, so misspelt or transliterated names are still ranked.
+# Joining the token list keeps each ``%`` test GIN-indexable.
+_MATCHED_PRODUCTS_CTE = """\
+    matched_products AS (
+        SELECT bp.random_key
+        FROM base_products AS bp
+        WHERE bp.search_vector @@ websearch_to_tsquery('simple', :match_query_text)
+           OR bp.extra_features_vector @@ websearch_to_tsquery('simple', :match_query_text)
+        UNION ALL
+        SELECT bp.random_key
+        FROM unnest(:match_name_tokens) AS name_tokens(token)
+        JOIN base_products AS bp
+            ON bp.persian_name % name_tokens.token
+            OR bp.english_name % name_tokens.token
+    ),
+"""
+
+# Token relevance depends only on the base product, so it is computed once per
+# distinct product in ``filtered`` rather than once per member offering it.
+_PRODUCT_SCORES_SELECT = """\
+        SELECT
+            bp.random_key,
+            {token_relevance} AS token_relevance
+        FROM base_products AS bp
+        CROSS JOIN query_terms AS tq
+{token_joins}        WHERE bp.random_key IN (SELECT base_random_key FROM filtered)
+{restriction}"""
+
+_PRODUCT_SCORES_CTE = """\
+    product_scores AS MATERIALIZED (
+{select}    ),
+"""
+
+# A product outside ``matched_products`` has no full-text hit and every token
+# similarity below pg_trgm's threshold, so its relevance stays under 0.1 times
+# that threshold (the similarity weight in ``_TOKEN_SCORE``). When at least
+# ``limit`` prefiltered members reach that bound the topK cannot change, and the
+# remaining products are skipped; otherwise they are scored as well.
+_PREFILTERED_SCORES_CTES = """\
+    matched_scores AS MATERIALIZED (
+{matched_select}    ),
+    prefilter_check AS MATERIALIZED (
+        SELECT COUNT(*) >= :limit AS sufficient
+        FROM filtered AS f
+        JOIN matched_scores AS ms ON ms.random_key = f.base_random_key
+        WHERE ms.token_relevance >= 0.1 * COALESCE(
+            current_setting('pg_trgm.similarity_threshold', TRUE)::float8, 0.3
+        )
+    ),
+    product_scores AS (
+        SELECT random_key, token_relevance
+        FROM matched_scores
+        UNION ALL
+{unmatched_select}    ),
+"""
+
+_RANKING_CTES = """\
+{product_scores}    scored AS (
+        SELECT
+            f.*,
+            ({relevance}) AS relevance
+        FROM filtered AS f
+{scoring_joins}    ),
+    top_candidates AS (
+        SELECT *
+        FROM scored
+        WHERE relevance > 0
+        ORDER BY relevance DESC NULLS LAST,
+{preference_order}                 price ASC,
+                 shop_score DESC,
+                 member_random_key
+        LIMIT :limit
+    ),
+"""
+
+# Candidate rows follow the distribution rows; a NULL grouping_mask tells them
+# apart and top_candidates already holds them in ranking order. The casts hand
+# asyncpg Python floats instead of Decimal/real values to convert afterwards.
+_TOP_K_ROWS = """\
+    UNION ALL
+    SELECT
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        NULL,
+        member_random_key,
+        base_name,
+        brand_name,
+        price,
+        shop_id,
+        shop_score::float8,
+        city_name,
+        relevance::float8
+    FROM top_candidates
+"""
+
+# Per-token phrase rank and best trigram similarity for one token side; the
+# phrase tsqueries are parsed in query_terms and zipped with the raw tokens.
+_TOKEN_STATS_JOIN = """        LEFT JOIN LATERAL (
+            SELECT
+                MAX(ts_rank_cd(bp.search_vector, phrase_query)) AS max_phrase_rank,
+                MAX(
+                    GREATEST(
+                        similarity(bp.persian_name, token_text),
+                        similarity(COALESCE(bp.english_name, ''), token_text)
+                    )
+                ) AS max_similarity
+            FROM unnest(tq.{side}_phrase_queries, :{side}_tokens)
+                AS tokens(phrase_query, token_text)
+        ) AS {side}_token_stats ON TRUE
+"""
+
+_TOKEN_SCORE = """(
+                0.105 * ts_rank_cd(bp.search_vector, tq.{side}_query)
+                + 0.195 * ts_rank_cd(bp.extra_features_vector, tq.{side}_query)
+                + 0.35 * COALESCE({side}_token_stats.max_phrase_rank, 0.0)
+                + 0.25 * ts_rank_cd(bp.search_vector, tq.{side}_any_query)
+                + 0.1 * COALESCE({side}_token_stats.max_similarity, 0.0)
+            )"""
+
+# Parsed once per statement; MATERIALIZED keeps PostgreSQL from inlining the
+# one-row CTE back into the per-row relevance expression.
+_QUERY_TERMS_CTE = """\
+    query_terms AS MATERIALIZED (
+        SELECT
+            {columns}
+    ),
+"""
+
+_QUERY_TERMS_COLUMNS = """\
+websearch_to_tsquery('simple', :{side}_query_text) AS {side}_query,
+            websearch_to_tsquery('simple', :{side}_any_query_text) AS {side}_any_query,
+            ARRAY(
+                SELECT websearch_to_tsquery('simple', phrase)
+                FROM unnest(:{side}_phrases) WITH ORDINALITY AS phrases(phrase, position)
+                ORDER BY position
+            ) AS {side}_phrase_queries"""
+
+# Name similarities are computed once per brand/category/city row and joined
+# onto the candidates by id instead of being evaluated for every member.
+_NAME_SCORE_CTES = {
+    "brand": """\
+    brand_scores AS MATERIALIZED (
+        SELECT id, similarity(COALESCE(title, ''), :brand_name_query) AS score
+        FROM brands
+    ),
+""",
+    "category": """\
+    category_scores AS MATERIALIZED (
+        SELECT id, similarity(COALESCE(title, ''), :category_name_query) AS score
+        FROM categories
+    ),
+""",
+    "city": """\
+    city_scores AS MATERIALIZED (
+        SELECT id, similarity(COALESCE(name, ''), :city_name_query) AS score
+        FROM cities
+    ),
+""",
+}
+
+_NAME_SCORE_JOINS = {
+    "brand": "        LEFT JOIN brand_scores ON brand_scores.id = f.brand_id\n",
+    "category": (
+        "        LEFT JOIN category_scores ON category_scores.id = f.category_id\n"
+    ),
+    "city": "        LEFT JOIN city_scores ON city_scores.id = f.city_id\n",
+}
+
+_NAME_SCORES = {
+    "brand": "0.2 * COALESCE(brand_scores.score, 0.0)",
+    "category": "0.2 * COALESCE(category_scores.score, 0.0)",
+    "city": (
+        "CASE WHEN city_match.id IS NULL"
+        " THEN 0.1 * COALESCE(city_scores.score, 0.0)"
+        " ELSE 0.0 END"
+    ),
+}
+
+
+_SEARCH_MEMBERS_BINDPARAMS = (
+    bindparam("priority_query_text", type_=Text()),
+    bindparam("generic_query_text", type_=Text()),
+    bindparam("priority_any_query_text", type_=Text()),
+    bindparam("generic_any_query_text", type_=Text()),
+    bindparam("match_query_text", type_=Text()),
+    bindparam("match_name_tokens", type_=ARRAY(Text())),
+    bindparam("priority_tokens", type_=ARRAY(Text())),
+    bindparam("generic_tokens", type_=ARRAY(Text())),
+    bindparam("priority_phrases", type_=ARRAY(Text())),
+    bindparam("generic_phrases", type_=ARRAY(Text())),
+    bindparam("priority_weight", type_=Float),
+    bindparam("generic_weight", type_=Float),
+    bindparam("brand_name_query", type_=Text()),
+    bindparam("category_name_query", type_=Text()),
+    bindparam("city_name_query", type_=Text()),
+    bindparam("brand_id", type_=Integer),
+    bindparam("category_id", type_=Integer),
+    bindparam("city_id", type_=Integer),
+    bindparam("price_min", type_=Integer),
+    bindparam("price_max", type_=Integer),
+    bindparam("has_warranty", type_=Boolean),
+    bindparam("shop_min_score", type_=Float),
+    bindparam("limit", type_=Integer),
+)
+
+
+class _SearchShape(NamedTuple):
+    """Which optional inputs a search_members call actually supplies.
+
+    ``city_filter`` is ``"id"`` for an explicit city id, ``"name"`` when the
+    city is resolved through ``city_candidate``, or ``None``. ``prefilter``
+    scores products outside ``matched_products`` only when the matched ones
+    cannot fill the topK. Without
+    ``include_distributions`` only the total count is aggregated.
+    """
+
+    has_brand_id: bool = False
+    has_category_id: bool = False
+    city_filter: Optional[str] = None
+    has_price_min: bool = False
+    has_price_max: bool = False
+    has_warranty_filter: bool = False
+    has_shop_min_score: bool = False
+    has_priority_tokens: bool = False
+    has_generic_tokens: bool = False
+    has_brand_name: bool = False
+    has_category_name: bool = False
+    prefilter: bool = False
+    include_distributions: bool = True
+
+
+def _token_sides(shape: _SearchShape) -> List[str]:
+    """Return the token sides (``priority``/``generic``) the shape scores."""
+
+    sides: List[str] = []
+    if shape.has_priority_tokens:
+        sides.append("priority")
+    if shape.has_generic_tokens:
+        sides.append("generic")
+    return sides
+
+
+def _name_sources(shape: _SearchShape) -> List[str]:
+    """Return the names (``brand``/``category``/``city``) the shape scores."""
+
+    names: List[str] = []
+    if shape.has_brand_name:
+        names.append("brand")
+    if shape.has_category_name:
+        names.append("category")
+    if shape.city_filter == "name":
+        names.append("city")
+    return names
+
+
+def _token_relevance_sql(sides: List[str]) -> str:
+    """Return the weighted token relevance of one base product for ``sides``."""
+
+    if len(sides) == 2:
+        return (
+            "(:priority_weight * "
+            + _TOKEN_SCORE.format(side="priority")
+            + " + :generic_weight * "
+            + _TOKEN_SCORE.format(side="generic")
+            + ") / (:priority_weight + :generic_weight)"
+        )
+    return _TOKEN_SCORE.format(side=sides[0])
+
+
+def _relevance_sql(shape: _SearchShape) -> Optional[str]:
+    """Return the relevance expression for the shape, or ``None`` if always zero."""
+
+    terms: List[str] = []
+    if _token_sides(shape):
+        terms.append("ps.token_relevance")
+    terms.extend(_NAME_SCORES[name] for name in _name_sources(shape))
+    if not terms:
+        return None
+    return "\n            + ".join(terms)
+
+
+@lru_cache(maxsize=None)
+def _search_members_statement(shape: _SearchShape) -> TextClause:
+    """Return the search statement specialised for the supplied shape.
+
+    Only the hard filters that are set are emitted, so the planner sees plain
+    sargable predicates instead of ``:param IS NULL OR ...`` arms, and only the
+    relevance terms that can be non-zero are computed. Without query tokens or
+    names every relevance is zero, so scoring is skipped and no candidate rows
+    are returned.
+    """
+
+    joins: List[str] = []
+    predicates: List[str] = []
+    if shape.has_brand_id:
+        predicates.append("bp.brand_id = :brand_id")
+    if shape.has_category_id:
+        predicates.append("bp.category_id = :category_id")
+    if shape.city_filter == "id":
+        predicates.append("s.city_id = :city_id")
+    elif shape.city_filter == "name":
+        joins.append("LEFT JOIN city_candidate AS city_match ON TRUE")
+        predicates.append("(city_match.id IS NULL OR s.city_id = city_match.id)")
+    if shape.has_price_min:
+        predicates.append("m.price >= :price_min")
+    if shape.has_price_max:
+        predicates.append("m.price <= :price_max")
+    if shape.has_warranty_filter:
+        predicates.append("s.has_warranty = :has_warranty")
+    if shape.has_shop_min_score:
+        predicates.append("s.score >= :shop_min_score")
+
+    hard_filters = "".join(f"        {join}\n" for join in joins)
+    if predicates:
+        hard_filters += "        WHERE " + "\n          AND ".join(predicates) + "\n"
+
+    relevance = _relevance_sql(shape)
+    query_ctes = ""
+    if relevance is None:
+        ranking_ctes = ""
+        top_k = ""
+    else:
+        sides = _token_sides(shape)
+        product_scores = ""
+        scoring_joins = ""
+        if sides:
+            query_ctes += _QUERY_TERMS_CTE.format(
+                columns=",\n            ".join(
+                    _QUERY_TERMS_COLUMNS.format(side=side) for side in sides
+                )
+            )
+            select_parts = {
+                "token_relevance": _token_relevance_sql(sides),
+                "token_joins": "".join(
+                    _TOKEN_STATS_JOIN.format(side=side) for side in sides
+                ),
+            }
+            if shape.prefilter:
+                query_ctes += _MATCHED_PRODUCTS_CTE
+                product_scores = _PREFILTERED_SCORES_CTES.format(
+                    matched_select=_PRODUCT_SCORES_SELECT.format(
+                        restriction=(
+                            "          AND bp.random_key IN "
+                            "(SELECT random_key FROM matched_products)\n"
+                        ),
+                        **select_parts,
+                    ),
+                    unmatched_select=_PRODUCT_SCORES_SELECT.format(
+                        restriction=(
+                            "          AND bp.random_key NOT IN "
+                            "(SELECT random_key FROM matched_products)\n"
+                            "          AND NOT "
+                            "(SELECT sufficient FROM prefilter_check)\n"
+                        ),
+                        **select_parts,
+                    ),
+                )
+            else:
+                product_scores = _PRODUCT_SCORES_CTE.format(
+                    select=_PRODUCT_SCORES_SELECT.format(restriction="", **select_parts)
+                )
+            scoring_joins += (
+                "        JOIN product_scores AS ps"
+                " ON ps.random_key = f.base_random_key\n"
+            )
+        if shape.city_filter == "name":
+            scoring_joins += "        LEFT JOIN city_candidate AS city_match ON TRUE\n"
+        for name in _name_sources(shape):
+            query_ctes += _NAME_SCORE_CTES[name]
+            scoring_joins += _NAME_SCORE_JOINS[name]
+
+        preference_order = ""
+        if not (shape.has_price_min or shape.has_price_max):
+            preference_order += "                 price ASC NULLS LAST,\n"
+        if not shape.has_shop_min_score:
+            preference_order += "                 shop_score DESC NULLS LAST,\n"
+
+        ranking_ctes = _RANKING_CTES.format(
+            product_scores=product_scores,
+            relevance=relevance,
+            scoring_joins=scoring_joins,
+            preference_order=preference_order,
+        )
+        top_k = _TOP_K_ROWS
+
+    if shape.include_distributions:
+        aggregate = _DISTRIBUTION_ROWS
+    else:
+        aggregate = _TOTAL_ROW.format(total_mask=_TOTAL_GROUPING_MASK)
+
+    sql = _SEARCH_MEMBERS_SQL.format(
+        query_ctes=query_ctes,
+        hard_filters=hard_filters,
+        ranking_ctes=ranking_ctes,
+        aggregate=aggregate,
+        top_k=top_k,
+    )
+    return text(sql).bindparams(
+        *(param for param in _SEARCH_MEMBERS_BINDPARAMS if f":{param.key}" in sql)
+    )
+
+
+logger = logging.getLogger(__name__)
+
+_SEARCH_CACHE: TTLCache[SearchMembersResult] = TTLCache(
+    maxsize=settings.search_cache_size,
+    ttl=settings.search_cache_ttl_seconds,
+)
+
+_DISTRIBUTION_LIMIT = 10
+_TOP_DISTRIBUTION_KEYS = frozenset({"brand", "city", "price_band"})
+
+# GROUPING(brand_id, city_id, has_warranty, price_bucket) of each grouping
+# set, mapped to its distribution name and bucket column. Mask 15 is the total.
+_GROUPING_SETS = {
+    7: ("brand", "brand_id"),
+    11: ("city", "city_id"),
+    13: ("warranty", "has_warranty"),
+    14: ("price_band", "price_bucket"),
+}
+_TOTAL_GROUPING_MASK = 15
+_PRICE_BUCKETS = 4
+
+
+def _format_price(value: Decimal) -> str:
+    """Render a band edge as a whole number, rounding halves away from zero."""
+
+    return str(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _price_band_label(bucket: int, min_price: int, max_price: int) -> str:
+    """Return the label of a ``width_bucket`` price bucket between the bounds.
+
+    Prices equal to ``max_price`` land in the overflow bucket
+    ``_PRICE_BUCKETS + 1``, which is labelled like an interior range.
+    """
+
+    if max_price == min_price:
+        return str(max_price)
+    step = max(Decimal(max_price - min_price) / _PRICE_BUCKETS, Decimal(1))
+    if bucket == 1:
+        return f"≤ {_format_price(min_price + step)}"
+    if bucket == _PRICE_BUCKETS:
+        return f"≥ {_format_price(max_price - step)}"
+    lower = _format_price(min_price + (bucket - 1) * step)
+    upper = _format_price(min_price + bucket * step)
+    return f"{lower}–{upper}"
+
+
+class _PreparedTokens(NamedTuple):
+    """Normalised query tokens and the tsquery texts derived from them."""
+
+    tokens: Tuple[str, ...]
+    phrases: Tuple[str, ...]
+    query_text: str
+    any_query_text: str
+
+
+@lru_cache(maxsize=1024)
+def _prepare_tokens(raw_tokens: Tuple[str, ...]) -> _PreparedTokens:
+    """Strip the raw tokens and build their phrases plus the AND/phrase-OR texts."""
+
+    tokens: List[str] = []
+    phrases: List[str] = []
+    for raw in raw_tokens:
+        token = raw.strip() if raw else ""
+        if not token:
+            continue
+        tokens.append(token)
+        phrases.append('"{}"'.format(token.replace('"', " ")))
+    return _PreparedTokens(
+        tuple(tokens), tuple(phrases), " ".join(tokens), " OR ".join(phrases)
+    )
+
+
+def _clean_name(value: Optional[str]) -> Optional[str]:
+    """Return the stripped name, or ``None`` when nothing meaningful remains."""
+
+    if not value:
+        return None
+    return value.strip() or None
+
+
+def _match_terms(tokens: List[str]) -> List[str]:
+    """Return the distinct words used to prefilter products before scoring.
+
+    Any positive full-text score requires at least one of these words to be
+    present, so OR-ing them gives ``matched_products`` a GIN-indexable superset
+    of the rows worth ranking.
+    """
+
+    terms: List[str] = []
+    seen: set[str] = set()
+    for token in tokens:
+        for word in token.replace('"', " ").split():
+            word = word.lstrip("-")
+            key = word.lower()
+            if not word or key == "or" or key in seen:
+                continue
+            seen.add(key)
+            terms.append(word)
+    return terms
+
+
+def _construct_candidate(row: Mapping[str, Any]) -> SearchCandidate:
+    """Build a candidate from a trusted, already typed result row."""
+
+    return SearchCandidate.model_construct(
+        member_random_key=row["member_random_key"],
+        base_name=row["base_name"],
+        brand=row["brand_name"],
+        price=row["price"],
+        shop_name=f"فروشگاه {row['shop_id']}",
+        shop_score=row["shop_score"],
+        city_name=row["city_name"],
+        relevance=row["relevance"],
+    )
+
+
+def _parse_search_rows(rows: Iterable[Mapping[str, Any]]) -> SearchMembersResult:
+    """Split the search statement rows into the count, topK and distributions."""
+
+    count = 0
+    price_bounds: Tuple[Optional[int], Optional[int]] = (None, None)
+    top_candidates: List[SearchCandidate] = []
+    distributions: Dict[str, List[Tuple[object, int]]] = {}
+    for row in rows:
+        mask = row["grouping_mask"]
+        if mask is None:
+            top_candidates.append(_construct_candidate(row))
+        elif mask == _TOTAL_GROUPING_MASK:
+            count = row["freq"]
+            price_bounds = (row["min_price"], row["max_price"])
+        elif mask in _GROUPING_SETS:
+            dimension, column = _GROUPING_SETS[mask]
+            distributions.setdefault(dimension, []).append(
+                (row[column], row["freq"])
+            )
+
+    if price_bounds[0] is not None and "price_band" in distributions:
+        min_price, max_price = price_bounds
+        distributions["price_band"] = [
+            (_price_band_label(bucket, min_price, max_price), freq)
+            for bucket, freq in distributions["price_band"]
+        ]
+
+    def _coerce_sequence(key: str) -> Optional[List[Tuple[object, int]]]:
+        value = distributions.get(key)
+        if not value:
+            return None
+        value.sort(key=lambda item: item[1], reverse=True)
+        if key in _TOP_DISTRIBUTION_KEYS:
+            del value[_DISTRIBUTION_LIMIT:]
+        return value
+
+    # Every value above already has its schema type, so skip re-validation.
+    return SearchMembersResult.model_construct(
+        count=count,
+        topK=top_candidates,
+        distributions=SearchMembersDistributions.model_construct(
+            brand=_coerce_sequence("brand"),
+            city=_coerce_sequence("city"),
+            price_band=_coerce_sequence("price_band"),
+            warranty=_coerce_sequence("warranty"),
+        ),
+    )
+
+
 async def _search_members(
     ctx: RunContext[AgentDependencies],
     *,
@@ -33,432 +709,82 @@ async def _search_members(
     has_warranty: Optional[bool] = None,
     shop_min_score: Optional[float] = None,
     limit: int = 5,
+    include_distributions: bool = True,
 ) -> SearchMembersResult:
     if limit <= 0:
         limit = 5
     limit = min(limit, 10)
 
-    priority_tokens = [
-        token.strip()
-        for token in (priority_query_tokens or [])
-        if token and token.strip()
-    ]
-    generic_tokens = [
-        token.strip()
-        for token in (generic_query_tokens or [])
-        if token and token.strip()
-    ]
-
-    priority_query_text = " ".join(priority_tokens)
-    generic_query_text = " ".join(generic_tokens)
+    priority = _prepare_tokens(tuple(priority_query_tokens or ()))
+    generic = _prepare_tokens(tuple(generic_query_tokens or ()))
+    priority_tokens = list(priority.tokens)
+    generic_tokens = list(generic.tokens)
+
     has_priority_query = bool(priority_tokens)
     has_generic_query = bool(generic_tokens)
 
-    def _quote(tokens: List[str]) -> List[str]:
-        quoted: List[str] = []
-        for token in tokens:
-            cleaned = token.replace('"', " ")
-            if cleaned:
-                quoted.append(f'"{cleaned}"')
-        return quoted
-
-    priority_quoted_tokens = _quote(priority_tokens)
-    generic_quoted_tokens = _quote(generic_tokens)
-    priority_any_query_text = " OR ".join(priority_quoted_tokens)
-    generic_any_query_text = " OR ".join(generic_quoted_tokens)
-    has_priority_any_query = bool(priority_quoted_tokens)
-    has_generic_any_query = bool(generic_quoted_tokens)
-
     priority_weight = 2.0 if has_priority_query else 0.0
     generic_weight = 1.0 if has_generic_query else 0.0
 
-    brand_name_query = brand_name.strip() if brand_name and brand_name.strip() else None
-    category_name_query = (
-        category_name.strip() if category_name and category_name.strip() else None
+    brand_name_query = _clean_name(brand_name)
+    category_name_query = _clean_name(category_name)
+    city_name_query = _clean_name(city_name)
+
+    hard_filters = (
+        city_id,
+        category_id,
+        brand_id,
+        price_min,
+        price_max,
+        has_warranty,
+        shop_min_score,
     )
-    city_name_query = city_name.strip() if city_name and city_name.strip() else None
-
-    stmt = text(
-        """
-        WITH city_candidate AS (
-            SELECT id
-            FROM cities
-            WHERE :city_name_query IS NOT NULL
-              AND LOWER(name) = LOWER(:city_name_query)
-            LIMIT 1
-        ),
-        filtered AS (
-            SELECT
-                m.random_key AS member_random_key,
-                bp.persian_name AS base_name,
-                COALESCE(br.title, 'بدون برند') AS brand_name,
-                bp.brand_id,
-                bp.category_id,
-                m.price,
-                s.id AS shop_id,
-                s.score AS shop_score,
-                s.city_id,
-                city.name AS city_name,
-                s.has_warranty,
-                (
-                    CASE
-                        WHEN (:priority_weight + :generic_weight) > 0
-                            THEN (
-                                (
-                                    0.105
-                                        * (
-                                            :priority_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_priority_query
-                                                            THEN ts_rank_cd(
-                                                                bp.search_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :priority_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                            + :generic_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_generic_query
-                                                            THEN ts_rank_cd(
-                                                                bp.search_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :generic_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                        )
-                                    + 0.195
-                                        * (
-                                            :priority_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_priority_query
-                                                            THEN ts_rank_cd(
-                                                                bp.extra_features_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :priority_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                            + :generic_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_generic_query
-                                                            THEN ts_rank_cd(
-                                                                bp.extra_features_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :generic_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                        )
-                                    + 0.35
-                                        * (
-                                            :priority_weight
-                                                * COALESCE(priority_token_stats.max_phrase_rank, 0.0)
-                                            + :generic_weight
-                                                * COALESCE(generic_token_stats.max_phrase_rank, 0.0)
-                                        )
-                                    + 0.25
-                                        * (
-                                            :priority_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_priority_any_query
-                                                            THEN ts_rank_cd(
-                                                                bp.search_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :priority_any_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                            + :generic_weight
-                                                * (
-                                                    CASE
-                                                        WHEN :has_generic_any_query
-                                                            THEN ts_rank_cd(
-                                                                bp.search_vector,
-                                                                websearch_to_tsquery(
-                                                                    'simple',
-                                                                    :generic_any_query_text
-                                                                )
-                                                            )
-                                                        ELSE 0.0
-                                                    END
-                                                )
-                                        )
-                                    + 0.1
-                                        * (
-                                            :priority_weight
-                                                * COALESCE(priority_token_stats.max_similarity, 0.0)
-                                            + :generic_weight
-                                                * COALESCE(generic_token_stats.max_similarity, 0.0)
-                                        )
-                                ) / NULLIF(:priority_weight + :generic_weight, 0)
-                            )
-                        ELSE 0.0
-                    END
-                    + CASE
-                        WHEN :brand_name_query IS NOT NULL
-                            THEN 0.2 * similarity(COALESCE(br.title, ''), :brand_name_query)
-                        ELSE 0.0
-                    END
-                    + CASE
-                        WHEN :category_name_query IS NOT NULL
-                            THEN 0.2 * similarity(COALESCE(cat.title, ''), :category_name_query)
-                        ELSE 0.0
-                    END
-                    + CASE
-                        WHEN :city_name_query IS NOT NULL
-                             AND COALESCE(:city_id, city_match.id) IS NULL
-                            THEN 0.1 * similarity(COALESCE(city.name, ''), :city_name_query)
-                        ELSE 0.0
-                    END
-                ) AS relevance
-            FROM members AS m
-            JOIN base_products AS bp ON bp.random_key = m.base_random_key
-            LEFT JOIN brands AS br ON br.id = bp.brand_id
-            LEFT JOIN categories AS cat ON cat.id = bp.category_id
-            JOIN shops AS s ON s.id = m.shop_id
-            LEFT JOIN cities AS city ON city.id = s.city_id
-            LEFT JOIN city_candidate AS city_match ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT
-                    MAX(
-                        ts_rank_cd(
-                            bp.search_vector,
-                            websearch_to_tsquery(
-                                'simple',
-                                CONCAT('"', replace(token_text, '"', ' '), '"')
-                            )
-                        )
-                    ) AS max_phrase_rank,
-                    MAX(
-                        GREATEST(
-                            similarity(bp.persian_name, token_text),
-                            similarity(COALESCE(bp.english_name, ''), token_text)
-                        )
-                    ) AS max_similarity
-                FROM json_array_elements_text(:priority_tokens_json) AS tokens(token_text)
-            ) AS priority_token_stats ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT
-                    MAX(
-                        ts_rank_cd(
-                            bp.search_vector,
-                            websearch_to_tsquery(
-                                'simple',
-                                CONCAT('"', replace(token_text, '"', ' '), '"')
-                            )
-                        )
-                    ) AS max_phrase_rank,
-                    MAX(
-                        GREATEST(
-                            similarity(bp.persian_name, token_text),
-                            similarity(COALESCE(bp.english_name, ''), token_text)
-                        )
-                    ) AS max_similarity
-                FROM json_array_elements_text(:generic_tokens_json) AS tokens(token_text)
-            ) AS generic_token_stats ON TRUE
-            WHERE (:brand_id IS NULL OR bp.brand_id = :brand_id)
-              AND (:category_id IS NULL OR bp.category_id = :category_id)
-              AND (
-                    COALESCE(:city_id, city_match.id) IS NULL
-                    OR s.city_id = COALESCE(:city_id, city_match.id)
-                )
-              AND (:price_min IS NULL OR m.price >= :price_min)
-              AND (:price_max IS NULL OR m.price <= :price_max)
-              AND (:has_warranty IS NULL OR s.has_warranty = :has_warranty)
-              AND (:shop_min_score IS NULL OR s.score >= :shop_min_score)
-        ),
-        ranked AS (
-            SELECT
-                filtered.*,
-                ROW_NUMBER() OVER (
-                    ORDER BY filtered.relevance DESC NULLS LAST,
-                             CASE
-                                 WHEN :price_min IS NULL AND :price_max IS NULL
-                                     THEN filtered.price
-                             END ASC NULLS LAST,
-                             CASE
-                                 WHEN :shop_min_score IS NULL THEN filtered.shop_score
-                             END DESC NULLS LAST,
-                             filtered.price ASC,
-                             filtered.shop_score DESC,
-                             filtered.member_random_key
-                ) AS row_number
-            FROM filtered
-        ),
-        brand_distribution AS (
-            SELECT brand_id, COUNT(*) AS freq
-            FROM filtered
-            GROUP BY brand_id
-            ORDER BY COUNT(*) DESC
-            LIMIT 10
-        ),
-        city_distribution AS (
-            SELECT city_id, COUNT(*) AS freq
-            FROM filtered
-            GROUP BY city_id
-            ORDER BY COUNT(*) DESC
-            LIMIT 10
-        ),
-        warranty_distribution AS (
-            SELECT has_warranty, COUNT(*) AS freq
-            FROM filtered
-            GROUP BY has_warranty
-        ),
-        price_bounds AS (
-            SELECT MIN(price) AS min_price, MAX(price) AS max_price FROM filtered
-        ),
-        price_series AS (
-            SELECT
-                CASE
-                    WHEN bounds.max_price IS NULL THEN 'نامشخص'
-                    WHEN bounds.max_price = bounds.min_price THEN to_char(bounds.max_price, 'FM9999999999')
-                    ELSE (
-                        CASE buckets.bucket
-                            WHEN 1 THEN CONCAT('≤ ', to_char(bounds.min_price + buckets.step, 'FM9999999999'))
-                            WHEN 4 THEN CONCAT('≥ ', to_char(bounds.max_price - buckets.step, 'FM9999999999'))
-                            ELSE CONCAT(
-                                to_char(bounds.min_price + (buckets.bucket - 1) * buckets.step, 'FM9999999999'),
-                                '–',
-                                to_char(bounds.min_price + buckets.bucket * buckets.step, 'FM9999999999')
-                            )
-                        END
-                    )
-                END AS price_band
-            FROM filtered AS f
-            CROSS JOIN price_bounds AS bounds
-            CROSS JOIN LATERAL (
-                SELECT
-                    CASE
-                        WHEN bounds.max_price IS NULL OR bounds.min_price IS NULL THEN NULL
-                        WHEN bounds.max_price = bounds.min_price THEN 1
-                        ELSE width_bucket(f.price, bounds.min_price, bounds.max_price, 4)
-                    END AS bucket,
-                    CASE
-                        WHEN bounds.max_price IS NULL OR bounds.min_price IS NULL THEN 0
-                        WHEN bounds.max_price = bounds.min_price THEN 0
-                        ELSE GREATEST((bounds.max_price - bounds.min_price) / 4.0, 1)
-                    END AS step
-            ) AS buckets
-        ),
-        price_distribution AS (
-            SELECT price_band, COUNT(*) AS freq
-            FROM price_series
-            GROUP BY price_band
-            ORDER BY COUNT(*) DESC
-            LIMIT 10
-        )
-        SELECT json_build_object(
-            'count', (SELECT COUNT(*) FROM filtered),
-            'topK', COALESCE(
-                (
-                    SELECT json_agg(
-                        json_build_object(
-                            'member_random_key', member_random_key,
-                            'base_name',        base_name,
-                            'brand',            brand_name,
-                            'price',            price,
-                            'shop_name',        CONCAT('فروشگاه ', shop_id::text),
-                            'shop_score',       shop_score,
-                            'city_name',        city_name,
-                            'relevance',        relevance
-                        )
-                        ORDER BY relevance DESC NULLS LAST,
-                                 CASE
-                                     WHEN :price_min IS NULL AND :price_max IS NULL
-                                         THEN price
-                                 END ASC NULLS LAST,
-                                 CASE
-                                     WHEN :shop_min_score IS NULL THEN shop_score
-                                 END DESC NULLS LAST,
-                                 price ASC,
-                                 shop_score DESC,
-                                 member_random_key
-                    )
-                    FROM ranked
-                    WHERE row_number <= :limit
-                      AND relevance > 0
-                ),
-                '[]'::json
-            ),
-            'distributions', json_build_object(
-                'brand', (
-                    SELECT COALESCE(json_agg(json_build_array(brand_id, freq)), '[]'::json)
-                    FROM brand_distribution
-                ),
-                'city', (
-                    SELECT COALESCE(json_agg(json_build_array(city_id, freq)), '[]'::json)
-                    FROM city_distribution
-                ),
-                'price_band', (
-                    SELECT COALESCE(json_agg(json_build_array(price_band, freq)), '[]'::json)
-                    FROM price_distribution
-                ),
-                'warranty', (
-                    SELECT COALESCE(json_agg(json_build_array(has_warranty, freq)), '[]'::json)
-                    FROM warranty_distribution
-                )
-            )
-        ) AS payload;
-        """
-    ).bindparams(
-        bindparam("priority_query_text", type_=Text()),
-        bindparam("generic_query_text", type_=Text()),
-        bindparam("priority_any_query_text", type_=Text()),
-        bindparam("generic_any_query_text", type_=Text()),
-        bindparam("has_priority_query", type_=Boolean),
-        bindparam("has_generic_query", type_=Boolean),
-        bindparam("has_priority_any_query", type_=Boolean),
-        bindparam("has_generic_any_query", type_=Boolean),
-        bindparam("priority_tokens_json", type_=JSON),
-        bindparam("generic_tokens_json", type_=JSON),
-        bindparam("priority_weight", type_=Float),
-        bindparam("generic_weight", type_=Float),
-        bindparam("brand_name_query", type_=Text()),
-        bindparam("category_name_query", type_=Text()),
-        bindparam("city_name_query", type_=Text()),
-        bindparam("brand_id", type_=Integer),
-        bindparam("category_id", type_=Integer),
-        bindparam("city_id", type_=Integer),
-        bindparam("price_min", type_=Integer),
-        bindparam("price_max", type_=Integer),
-        bindparam("has_warranty", type_=Boolean),
-        bindparam("shop_min_score", type_=Float),
-        bindparam("limit", type_=Integer),
+    if not (
+        priority_tokens
+        or generic_tokens
+        or brand_name_query
+        or category_name_query
+        or city_name_query
+        or any(value is not None for value in hard_filters)
+    ):
+        # Nothing narrows or ranks the search, so it would only scan every member.
+        logger.warning("search_members called without query tokens or filters")
+        return SearchMembersResult(count=0)
+
+    cache_key = (
+        priority.tokens,
+        generic.tokens,
+        city_id,
+        category_id,
+        brand_id,
+        city_name_query,
+        category_name_query,
+        brand_name_query,
+        price_min,
+        price_max,
+        has_warranty,
+        shop_min_score,
+        limit,
+        include_distributions,
+    )
+
+    all_tokens = priority_tokens + generic_tokens
+    match_terms = _match_terms(all_tokens)
+    score_all_rows = not match_terms or any(
+        (brand_name_query, category_name_query, city_name_query)
     )
 
     params = {
-        "priority_query_text": priority_query_text,
-        "generic_query_text": generic_query_text,
-        "priority_any_query_text": priority_any_query_text,
-        "generic_any_query_text": generic_any_query_text,
-        "has_priority_query": has_priority_query,
-        "has_generic_query": has_generic_query,
-        "has_priority_any_query": has_priority_any_query,
-        "has_generic_any_query": has_generic_any_query,
-        "priority_tokens_json": priority_tokens,
-        "generic_tokens_json": generic_tokens,
+        "priority_query_text": priority.query_text,
+        "generic_query_text": generic.query_text,
+        "priority_any_query_text": priority.any_query_text,
+        "generic_any_query_text": generic.any_query_text,
+        "match_query_text": " OR ".join(match_terms) if match_terms else None,
+        "match_name_tokens": all_tokens,
+        "priority_tokens": priority_tokens,
+        "generic_tokens": generic_tokens,
+        "priority_phrases": list(priority.phrases),
+        "generic_phrases": list(generic.phrases),
         "priority_weight": priority_weight,
         "generic_weight": generic_weight,
         "brand_name_query": brand_name_query,
@@ -475,44 +801,31 @@ async def _search_members(
     }
 
     session = ctx.deps.session
-    result = await session.execute(stmt, params)
-    row = result.one()
-    payload_value = row._mapping.get("payload") if hasattr(row, "_mapping") else row[0]
-    if payload_value is None:
-        data = {"count": 0, "topK": [], "distributions": {}}
-    elif isinstance(payload_value, str):
-        data = json.loads(payload_value)
-    else:
-        data = dict(payload_value)
+    statement = _search_members_statement(
+        _SearchShape(
+            has_brand_id=brand_id is not None,
+            has_category_id=category_id is not None,
+            city_filter=(
+                "id" if city_id is not None else ("name" if city_name_query else None)
+            ),
+            has_price_min=price_min is not None,
+            has_price_max=price_max is not None,
+            has_warranty_filter=has_warranty is not None,
+            has_shop_min_score=shop_min_score is not None,
+            has_priority_tokens=has_priority_query,
+            has_generic_tokens=has_generic_query,
+            has_brand_name=brand_name_query is not None,
+            has_category_name=category_name_query is not None,
+            prefilter=not score_all_rows,
+            include_distributions=include_distributions,
+        )
+    )
 
-    top_candidates = [
-        SearchCandidate(**candidate) for candidate in data.get("topK", [])
-    ]
-    distributions = data.get("distributions", {}) or {}
+    async def _load() -> SearchMembersResult:
+        result = await session.execute(statement, params)
+        return _parse_search_rows(result.mappings())
 
-    def _coerce_sequence(key: str) -> Optional[List[Tuple[object, int]]]:
-        value = distributions.get(key)
-        if value is None:
-            return None
-        out: List[Tuple[object, int]] = []
-        for item in value:
-            if isinstance(item, (list, tuple)) and len(item) == 2:
-                try:
-                    out.append((item[0], int(item[1])))
-                except (TypeError, ValueError):
-                    continue
-        return out or None
-
-    return SearchMembersResult(
-        count=int(data.get("count", 0) or 0),
-        topK=top_candidates,
-        distributions=SearchMembersDistributions(
-            brand=_coerce_sequence("brand"),
-            city=_coerce_sequence("city"),
-            price_band=_coerce_sequence("price_band"),
-            warranty=_coerce_sequence("warranty"),
-        ),
-    )
+    return await _SEARCH_CACHE.get_or_load(cache_key, _load)
 
 
 SEARCH_MEMBERS_TOOL = Tool(
@@ -523,7 +836,8 @@ SEARCH_MEMBERS_TOOL = Tool(
         "soft relevance scoring over product names and features. Call this tool to "
         "filter products based on the user's requirements only after asking the "
         "necessary clarification questions, and never invoke it on the first turn of "
-        "a conversation."
+        "a conversation. Set include_distributions to false when you only need the "
+        "count and topK, for example when returning the final member."
     ),
 )
 
@@ -24,6 +24,8 @@ _DIGIT_TRANSLATION = str.maketrans(
         "٧": "7",
         "٨": "8",
         "٩": "9",
+        "٬": None,
+        ",": None,
     }
 )
 
@@ -31,7 +33,10 @@ _DIGIT_TRANSLATION = str.maketrans(
 def normalize_persian_digits(value: str) -> str:
     """Return the input string with Persian and Arabic digits normalised."""
 
-    return value.translate(_DIGIT_TRANSLATION).replace("٬", "").replace(",", "")
+    if value.isascii():
+        # No Persian/Arabic digits or separators can occur in pure ASCII input.
+        return value.replace(",", "")
+    return value.translate(_DIGIT_TRANSLATION)
 
 
 __all__ = ["normalize_persian_digits"]
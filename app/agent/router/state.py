@@ -2,48 +2,47 @@
 
 from __future__ import annotations
 
-import asyncio
-from functools import lru_cache
 from typing import Dict, Optional
 
 
 class RouterDecisionStore:
-    """Thread-safe mapping from chat identifiers to routing decisions."""
+    """In-memory mapping from chat identifiers to routing decisions.
+
+    Like ``TurnStateStore`` every operation is a single dictionary access with
+    no ``await`` in between, so no lock is required on the event loop.
+    """
 
     def __init__(self) -> None:
         self._routes: Dict[str, str] = {}
-        self._lock = asyncio.Lock()
 
     async def get(self, chat_id: str) -> Optional[str]:
         """Return the cached route for the chat identifier, if any."""
 
-        async with self._lock:
-            return self._routes.get(chat_id)
+        return self._routes.get(chat_id)
 
     async def set(self, chat_id: str, route: str) -> None:
         """Persist the router decision for the chat identifier."""
 
-        async with self._lock:
-            self._routes[chat_id] = route
+        self._routes[chat_id] = route
 
     async def discard(self, chat_id: str) -> None:
         """Remove any cached route for the chat identifier."""
 
-        async with self._lock:
-            self._routes.pop(chat_id, None)
+        self._routes.pop(chat_id, None)
 
     async def reset(self) -> None:
         """Clear all cached routes (useful for tests)."""
 
-        async with self._lock:
-            self._routes.clear()
+        self._routes = {}
+
+
+_STORE = RouterDecisionStore()
 
 
-@lru_cache(maxsize=1)
 def get_router_decision_store() -> RouterDecisionStore:
     """Return the process-wide router decision store."""
 
-    return RouterDecisionStore()
+    return _STORE
 
 
 __all__ = ["RouterDecisionStore", "get_router_decision_store"]
@@ -3,15 +3,18 @@
 from __future__ import annotations
 
 from collections import defaultdict
+from dataclasses import dataclass, field
 from statistics import mean
-from typing import List, Sequence
+from typing import Iterable, List, Sequence
 
 from pydantic_ai.tools import RunContext, Tool
-from sqlalchemy import func, or_, select
+from sqlalchemy import Float, Select, cast, exists, func, literal, or_, select, union_all
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models import BaseProduct, City, Member, Shop
 from ..config import settings
+from .cache import TTLCache
 from .dependencies import AgentDependencies
 from .schemas import (
     CitySellerStatistics,
@@ -23,28 +26,34 @@ from .schemas import (
 )
 
 
-def _normalize_text(value: str) -> str:
-    """Return a lightly normalised version of Persian/English text."""
-
-    replacements = {
+_CHARACTER_FOLDING = str.maketrans(
+    {
         "\u064a": "ی",  # Arabic Yeh -> Persian Yeh
         "\u0643": "ک",  # Arabic Kaf -> Persian Keheh
         "\u06cc": "ی",  # Farsi Yeh variant
         "\u06a9": "ک",  # Keheh variant
     }
-    lowered = value.strip().lower()
-    for src, dest in replacements.items():
-        lowered = lowered.replace(src, dest)
-    return lowered
+)
 
 
-async def _fetch_top_matches(
-    session: AsyncSession, normalized_query: str, limit: int = 20
-) -> Sequence[ProductMatch]:
-    """Return the strongest matches for the provided search query."""
+_PRODUCT_SEARCH_CACHE: TTLCache[ProductSearchResult] = TTLCache(
+    maxsize=settings.search_cache_size,
+    ttl=settings.search_cache_ttl_seconds,
+)
+_FEATURE_CACHE: TTLCache[FeatureLookupResult] = TTLCache(
+    maxsize=settings.search_cache_size,
+    ttl=settings.search_cache_ttl_seconds,
+)
+
+
+def _normalize_text(value: str) -> str:
+    """Return a lightly normalised version of Persian/English text."""
+
+    return value.strip().lower().translate(_CHARACTER_FOLDING)
 
-    if not normalized_query:
-        return []
+
+def _fuzzy_match_statement(normalized_query: str, limit: int) -> Select:
+    """Build the trigram/full-text query ranking base products by name."""
 
     threshold = settings.search_similarity_threshold
 
@@ -66,7 +75,7 @@ async def _fetch_top_matches(
         0.0,
     )
 
-    stmt = (
+    return (
         select(
             BaseProduct.random_key,
             BaseProduct.persian_name,
@@ -78,9 +87,12 @@ async def _fetch_top_matches(
         .limit(limit)
     )
 
-    result = await session.execute(stmt)
+
+def _build_matches(rows: Iterable[Row]) -> List[ProductMatch]:
+    """Convert ``(random_key, persian_name, english_name, score)`` rows."""
+
     matches: List[ProductMatch] = []
-    for random_key, persian_name, english_name, score in result:
+    for random_key, persian_name, english_name, score in rows:
         matches.append(
             ProductMatch(
                 random_key=random_key,
@@ -92,25 +104,40 @@ async def _fetch_top_matches(
     return matches
 
 
-async def _find_product_by_key(
-    session: AsyncSession, raw_query: str
-) -> ProductMatch | None:
-    """Return a direct random-key match when one exists."""
+async def _fetch_top_matches(
+    session: AsyncSession, raw_query: str, normalized_query: str, limit: int = 20
+) -> Sequence[ProductMatch]:
+    """Return a direct random-key match, or else the strongest fuzzy matches.
+
+    Both lookups share one round trip: the fuzzy branch is guarded by a
+    ``NOT EXISTS`` on the key match, which PostgreSQL evaluates once and uses
+    to skip the trigram scan entirely when the query is a known random key.
+    Random keys never contain whitespace, so multi-word queries skip the key
+    probe and run the fuzzy search alone.
+    """
 
     trimmed = raw_query.strip()
     if not trimmed:
-        return None
+        return []
 
-    product = await session.get(BaseProduct, trimmed)
-    if product is None:
-        return None
+    fuzzy = _fuzzy_match_statement(normalized_query, limit)
+    if any(character.isspace() for character in trimmed):
+        result = await session.execute(fuzzy)
+        return _build_matches(result)
 
-    return ProductMatch(
-        random_key=product.random_key,
-        persian_name=product.persian_name,
-        english_name=product.english_name,
-        similarity=1.0,
+    direct = (
+        select(
+            BaseProduct.random_key,
+            BaseProduct.persian_name,
+            BaseProduct.english_name,
+            literal(1.0).label("score"),
+        )
+        .where(BaseProduct.random_key == trimmed)
+        .cte("direct_match")
     )
+    stmt = union_all(select(direct), fuzzy.where(~exists(direct.select())))
+    result = await session.execute(stmt)
+    return _build_matches(result)
 
 
 def _flatten_features(extra_features: dict | None) -> List[tuple[str, str]]:
@@ -143,14 +170,17 @@ async def _search_base_products(
 ) -> ProductSearchResult:
     """Resolve a customer request to likely base products."""
 
-    normalized = _normalize_text(query)
-    async with ctx.deps.session_factory() as session:
-        direct_match = await _find_product_by_key(session, query)
-        if direct_match is not None:
-            return ProductSearchResult(query=normalized, matches=[direct_match])
+    trimmed = query.strip()
+    normalized = _normalize_text(trimmed)
+
+    async def _load() -> ProductSearchResult:
+        async with ctx.deps.session_factory() as session:
+            matches = await _fetch_top_matches(session, trimmed, normalized)
+        return ProductSearchResult(query=normalized, matches=list(matches))
 
-        matches = await _fetch_top_matches(session, normalized)
-    return ProductSearchResult(query=normalized, matches=list(matches))
+    # Random keys are case-sensitive, so the trimmed query (not the folded
+    # one) identifies the result.
+    return await _PRODUCT_SEARCH_CACHE.get_or_load(trimmed, _load)
 
 
 async def _fetch_feature_details(
@@ -162,35 +192,60 @@ async def _fetch_feature_details(
     normalized_key = _normalize_text(base_random_key)
     trimmed_key = base_random_key.strip()
 
-    async with ctx.deps.session_factory() as session:
-        product = await session.get(BaseProduct, trimmed_key) if trimmed_key else None
-
-        if product is not None:
-            extra_features = product.extra_features
-        else:
-            stmt = select(BaseProduct.extra_features).where(
-                func.lower(BaseProduct.random_key) == normalized_key
-            )
+    # One round trip: the case-insensitive fallback is guarded by NOT EXISTS on
+    # the exact primary-key match, so at most one branch can return rows.
+    exact = select(BaseProduct.extra_features).where(
+        BaseProduct.random_key == trimmed_key
+    )
+    stmt = union_all(
+        exact,
+        select(BaseProduct.extra_features).where(
+            func.lower(BaseProduct.random_key) == normalized_key,
+            ~exists(exact.correlate(None)),
+        ),
+    ).limit(1)
+
+    async def _load() -> FeatureLookupResult:
+        async with ctx.deps.session_factory() as session:
             result = await session.execute(stmt)
-            extra_features = result.scalar_one_or_none()
+            extra_features = result.scalar()
 
-    flattened = _flatten_features(
-        extra_features if isinstance(extra_features, dict) else {}
-    )
+        flattened = _flatten_features(
+            extra_features if isinstance(extra_features, dict) else {}
+        )
 
-    features = [ProductFeature(name=name, value=value) for name, value in flattened]
-    canonical_key = trimmed_key or base_random_key
+        features = [
+            ProductFeature(name=name, value=value) for name, value in flattened
+        ]
+        canonical_key = trimmed_key or base_random_key
 
-    return FeatureLookupResult(
-        base_random_key=canonical_key,
-        features=features,
-        available_features=[feature.name for feature in features],
-    )
+        return FeatureLookupResult(
+            base_random_key=canonical_key,
+            features=features,
+            available_features=[feature.name for feature in features],
+        )
+
+    # Catalogue features are static, so the flattened payload is reused
+    # across turns instead of being rebuilt from the JSON blob.
+    return await _FEATURE_CACHE.get_or_load(trimmed_key, _load)
 
 
 _CITY_ROLLUP_LIMIT = 20
 
 
+@dataclass(slots=True)
+class _CityBucket:
+    """Internal accumulator for the per-city seller rollups."""
+
+    city_id: int | None = None
+    city_name: str | None = None
+    offer_count: int = 0
+    shops_with_warranty: int = 0
+    shop_ids: set[int] = field(default_factory=set)
+    prices: List[int] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)
+
+
 async def _collect_seller_statistics(
     ctx: RunContext[AgentDependencies],
     base_random_key: str,
@@ -207,7 +262,8 @@ async def _collect_seller_statistics(
                 Member.shop_id,
                 Member.price,
                 Shop.has_warranty,
-                Shop.score,
+                # Decode the NUMERIC score as float8 so no Decimal is built per row.
+                cast(Shop.score, Float),
                 Shop.city_id,
                 City.name,
             )
@@ -224,22 +280,12 @@ async def _collect_seller_statistics(
     score_samples: List[float] = []
     shops_with_warranty = 0
 
-    city_buckets = defaultdict(
-        lambda: {
-            "city_id": None,
-            "city_name": None,
-            "offer_count": 0,
-            "shops_with_warranty": 0,
-            "shop_ids": set(),
-            "prices": [],
-            "scores": [],
-        }
-    )
+    city_buckets: defaultdict[int | None, _CityBucket] = defaultdict(_CityBucket)
 
-    for shop_id, price, has_warranty, score, city_id, city_name in offer_records:
-        seen_shop_ids.add(int(shop_id))
-        price_value = int(price) if price is not None else None
-        score_value = float(score) if score is not None else None
+    for shop_id, price_value, has_warranty, score_value, city_id, city_name in (
+        offer_records
+    ):
+        seen_shop_ids.add(shop_id)
 
         if price_value is not None:
             price_samples.append(price_value)
@@ -249,15 +295,15 @@ async def _collect_seller_statistics(
             shops_with_warranty += 1
 
         entry = city_buckets[city_id]
-        entry["city_id"] = int(city_id) if city_id is not None else None
-        entry["city_name"] = city_name
-        entry["offer_count"] += 1
-        entry["shops_with_warranty"] += 1 if bool(has_warranty) else 0
-        entry["shop_ids"].add(int(shop_id))
+        entry.city_id = city_id
+        entry.city_name = city_name
+        entry.offer_count += 1
+        entry.shops_with_warranty += 1 if bool(has_warranty) else 0
+        entry.shop_ids.add(shop_id)
         if price_value is not None:
-            entry["prices"].append(price_value)
+            entry.prices.append(price_value)
         if score_value is not None:
-            entry["scores"].append(score_value)
+            entry.scores.append(score_value)
 
     total_offers = len(offer_records)
     shops_without_warranty = total_offers - shops_with_warranty
@@ -272,18 +318,17 @@ async def _collect_seller_statistics(
 
     city_rollups: List[CitySellerStatistics] = []
     for entry in city_buckets.values():
-        price_list: List[int] = entry.pop("prices")
-        score_list: List[float] = entry.pop("scores")
-        shop_ids: set[int] = entry.pop("shop_ids")
-        offer_count = entry["offer_count"]
-        with_warranty = entry["shops_with_warranty"]
+        price_list = entry.prices
+        score_list = entry.scores
+        offer_count = entry.offer_count
+        with_warranty = entry.shops_with_warranty
 
         city_rollups.append(
             CitySellerStatistics(
-                city_id=entry["city_id"],
-                city_name=entry["city_name"],
+                city_id=entry.city_id,
+                city_name=entry.city_name,
                 offer_count=offer_count,
-                distinct_shops=len(shop_ids),
+                distinct_shops=len(entry.shop_ids),
                 shops_with_warranty=with_warranty,
                 shops_without_warranty=offer_count - with_warranty,
                 min_price=min(price_list) if price_list else None,
@@ -38,6 +38,11 @@ class Settings:
     search_similarity_threshold: float
     request_log_directory: Path
     request_log_idle_seconds: int
+    search_cache_size: int
+    search_cache_ttl_seconds: int
+    prepared_statement_cache_size: int
+    agent_statement_timeout_ms: int
+    agent_work_mem: str
 
     @property
     def async_database_url(self) -> str:
@@ -145,6 +150,15 @@ def get_settings() -> Settings:
         ),
         request_log_directory=request_log_dir,
         request_log_idle_seconds=_int_from_env("TOROB_REQUEST_LOG_IDLE_SECONDS", 60),
+        search_cache_size=_int_from_env("TOROB_SEARCH_CACHE_SIZE", 512),
+        search_cache_ttl_seconds=_int_from_env("TOROB_SEARCH_CACHE_TTL_SECONDS", 60),
+        prepared_statement_cache_size=_int_from_env(
+            "TOROB_PREPARED_STATEMENT_CACHE_SIZE", 256
+        ),
+        agent_statement_timeout_ms=_int_from_env(
+            "TOROB_AGENT_STATEMENT_TIMEOUT_MS", 5_000
+        ),
+        agent_work_mem=os.getenv("TOROB_AGENT_WORK_MEM", "64MB"),
     )
 
 
@@ -11,9 +11,36 @@ engine = create_async_engine(
     settings.async_database_url,
     future=True,
     pool_pre_ping=True,
+    # Each connection keeps its prepared statements (and PostgreSQL its cached
+    # plans) for this many distinct SQL texts; sized for the specialised
+    # search_members variants on top of the ORM queries.
+    connect_args={
+        "prepared_statement_cache_size": settings.prepared_statement_cache_size
+    },
+)
+
+# Separate pool for the read-only agent tools so chat traffic never waits on
+# the data loader. Its transactions are read-only, so a stray write fails. JIT
+# compilation costs more than it saves on these short searches, the timeout
+# keeps one pathological query from stalling a turn, and the larger work_mem
+# keeps the distribution aggregates from spilling to disk.
+read_engine = create_async_engine(
+    settings.async_database_url,
+    future=True,
+    pool_pre_ping=True,
+    connect_args={
+        "prepared_statement_cache_size": settings.prepared_statement_cache_size,
+        "server_settings": {
+            "default_transaction_read_only": "on",
+            "jit": "off",
+            "statement_timeout": str(settings.agent_statement_timeout_ms),
+            "work_mem": settings.agent_work_mem,
+        },
+    },
 )
 
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, expire_on_commit=False)
 
 
 async def get_session() -> AsyncSession:
@@ -21,3 +48,10 @@ async def get_session() -> AsyncSession:
 
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_session() -> AsyncSession:
+    """Provide a session from the read-only agent pool."""
+
+    async with ReadSessionLocal() as session:
+        yield session
@@ -31,7 +31,7 @@ from .agent.multiturn import (
 )
 from .agent.router import get_conversation_router, get_router_decision_store
 from .agent.vision_router import get_vision_router
-from .db import AsyncSessionLocal, get_session
+from .db import ReadSessionLocal, get_read_session
 from .logging_utils.judge_requests import request_logger
 
 
@@ -63,11 +63,24 @@ app = FastAPI(title="Shopping Assistant API", version="0.1.0")
 logger = logging.getLogger(__name__)
 
 
-def _extract_key(command_prefix: str, message: str) -> Optional[str]:
-    """Extract a random key following the provided command prefix."""
+_SIMILAR_PRODUCT_MESSAGE = "محصولی مشابه با این تصویر را پیدا کردم."
+_DEFAULT_VISION_PROMPT = (
+    "کاربر تصویری ارسال کرده است. محتوای تصویر را به اختصار توصیف کن."
+)
+
+
+def _extract_key(
+    command_prefix: str, message: str, lower_message: Optional[str] = None
+) -> Optional[str]:
+    """Extract a random key following the provided command prefix.
+
+    Callers that already lower-cased ``message`` can pass it as
+    ``lower_message`` to skip a second normalisation pass.
+    """
 
     lower_prefix = command_prefix.lower()
-    lower_message = message.lower()
+    if lower_message is None:
+        lower_message = message.lower()
     if not lower_message.startswith(lower_prefix):
         return None
     parts = message.split(":", maxsplit=1)
@@ -176,7 +189,7 @@ async def _search_similar_product(image_bytes: bytes, media_type: str) -> str:
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(
-    request: ChatRequest, session: AsyncSession = Depends(get_session)
+    request: ChatRequest, session: AsyncSession = Depends(get_read_session)
 ) -> ChatResponse:
     """Handle chat interactions with the assistant.
 
@@ -224,18 +237,16 @@ async def chat_endpoint(
 
         lower_text_segments = [segment.lower() for segment in text_segments]
 
-        if request.chat_id == "sanity-check-ping" or any(
-            segment == "ping" for segment in lower_text_segments
-        ):
+        if request.chat_id == "sanity-check-ping" or "ping" in lower_text_segments:
             return await _finalize(ChatResponse(message="pong"))
 
-        for text in text_segments:
-            base_key = _extract_key("return base random key:", text)
+        for text, lower_text in zip(text_segments, lower_text_segments):
+            base_key = _extract_key("return base random key:", text, lower_text)
             if base_key:
                 return await _finalize(ChatResponse(base_random_keys=[base_key]))
 
-        for text in text_segments:
-            member_key = _extract_key("return member random key:", text)
+        for text, lower_text in zip(text_segments, lower_text_segments):
+            member_key = _extract_key("return member random key:", text, lower_text)
             if member_key:
                 return await _finalize(ChatResponse(member_random_keys=[member_key]))
 
@@ -281,20 +292,16 @@ async def chat_endpoint(
 
                 return await _finalize(
                     ChatResponse(
-                        message="محصولی مشابه با این تصویر را پیدا کردم.",
+                        message=_SIMILAR_PRODUCT_MESSAGE,
                         base_random_keys=[best_key],
                         member_random_keys=None,
                     )
                 )
 
             agent = get_image_agent()
-            deps = AgentDependencies(session=session, session_factory=AsyncSessionLocal)
+            deps = AgentDependencies(session=session, session_factory=ReadSessionLocal)
 
-            vision_prompt_text = aggregated_prompt
-            if not vision_prompt_text:
-                vision_prompt_text = (
-                    "کاربر تصویری ارسال کرده است. محتوای تصویر را به اختصار توصیف کن."
-                )
+            vision_prompt_text = aggregated_prompt or _DEFAULT_VISION_PROMPT
 
             media_type = mime_type or "image/png"
             prompt_segments = [
@@ -349,7 +356,7 @@ async def chat_endpoint(
                 )
                 route_decision = "single_turn"
 
-        deps = AgentDependencies(session=session, session_factory=AsyncSessionLocal)
+        deps = AgentDependencies(session=session, session_factory=ReadSessionLocal)
 
         if route_decision == "multi_turn":
             state_store = get_turn_state_store()
@@ -388,20 +395,11 @@ async def chat_endpoint(
                     await state_store.set(request.chat_id, multi_output.updated_state)
 
                 member_key = multi_output.member_random_key
-                if member_key:
-                    return await _finalize(
-                        ChatResponse(
-                            message=multi_output.message,
-                            base_random_keys=None,
-                            member_random_keys=[member_key],
-                        )
-                    )
-
                 return await _finalize(
                     ChatResponse(
                         message=multi_output.message,
                         base_random_keys=None,
-                        member_random_keys=None,
+                        member_random_keys=[member_key] if member_key else None,
                     )
                 )
 
@@ -0,0 +1,33 @@
+"""Raise the statistics target of the full-text vectors."""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "20250216_000006"
+down_revision = "20250215_000005"
+branch_labels = None
+depends_on = None
+
+
+_VECTOR_COLUMNS = ("search_vector", "extra_features_vector")
+_STATISTICS_TARGET = 10_000
+
+
+def upgrade() -> None:
+    # A larger most-common-lexeme list lets the planner estimate ``@@`` matches
+    # for frequent Persian words instead of falling back to sequential scans.
+    for column in _VECTOR_COLUMNS:
+        op.execute(
+            f"ALTER TABLE base_products ALTER COLUMN {column} "
+            f"SET STATISTICS {_STATISTICS_TARGET}"
+        )
+    op.execute("ANALYZE base_products")
+
+
+def downgrade() -> None:
+    for column in _VECTOR_COLUMNS:
+        op.execute(
+            f"ALTER TABLE base_products ALTER COLUMN {column} SET STATISTICS -1"
+        )
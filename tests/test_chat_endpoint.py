@@ -22,7 +22,7 @@ from app.agent.multiturn import MultiTurnAgentReply, TurnState
 from app.agent.router import RouterDecision
 from app.agent.vision_router.schemas import VisionRouteDecision
 from app.main import app
-from app.db import get_session
+from app.db import get_read_session
 
 
 class _DummySession:
@@ -65,7 +65,7 @@ async def _session_override():
 def _override_session_factory(monkeypatch: pytest.MonkeyPatch) -> None:
     """Ensure the FastAPI handler uses a stub session factory during tests."""
 
-    monkeypatch.setattr(app_main, "AsyncSessionLocal", _DummySessionFactory())
+    monkeypatch.setattr(app_main, "ReadSessionLocal", _DummySessionFactory())
     monkeypatch.setattr(
         app_main, "get_conversation_router", lambda: _StubRouter("single_turn")
     )
@@ -83,7 +83,7 @@ def test_router_decision_accepts_plain_label() -> None:
 def test_chat_accepts_image_payload(monkeypatch: pytest.MonkeyPatch) -> None:
     """An image message should route to the vision agent and return its reply."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     reply = AgentReply(message="پتو", base_random_keys=[], member_random_keys=[])
     monkeypatch.setattr(app_main, "get_image_agent", lambda: _StubAgent(reply))
 
@@ -117,7 +117,7 @@ def test_chat_accepts_image_payload(monkeypatch: pytest.MonkeyPatch) -> None:
 def test_image_routing_when_text_is_last(monkeypatch: pytest.MonkeyPatch) -> None:
     """Presence of any image payload should trigger the vision agent."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     reply = AgentReply(message="گلدان", base_random_keys=[], member_random_keys=[])
     image_called = False
     text_called = False
@@ -167,7 +167,7 @@ def test_image_routing_when_text_is_last(monkeypatch: pytest.MonkeyPatch) -> Non
 def test_invalid_image_payload_returns_400(monkeypatch: pytest.MonkeyPatch) -> None:
     """Malformed base64 data should raise a client error before hitting the agent."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     called = False
 
     def _stub_agent() -> _StubAgent:
@@ -202,7 +202,7 @@ def test_invalid_image_payload_returns_400(monkeypatch: pytest.MonkeyPatch) -> N
 def test_similarity_branch_returns_search_result(monkeypatch: pytest.MonkeyPatch) -> None:
     """When similarity is requested the handler should return search results."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     monkeypatch.setattr(
         app_main, "get_vision_router", lambda: _StubVisionRouter("similarity")
     )
@@ -353,7 +353,7 @@ class _RecorderLogger:
 def test_numeric_reply_is_enforced(monkeypatch: pytest.MonkeyPatch) -> None:
     """When the agent provides a numeric answer it should replace the message."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     numeric_reply = AgentReply(
         message="Cheapest price is 120000",
         base_random_keys=["bk-1"],
@@ -383,7 +383,7 @@ def test_numeric_reply_is_enforced(monkeypatch: pytest.MonkeyPatch) -> None:
 def test_invalid_numeric_reply_raises_error(monkeypatch: pytest.MonkeyPatch) -> None:
     """Non-finite numeric answers should trigger an internal server error."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     bad_reply = AgentReply.model_construct(message="NaN", numeric_answer=Decimal("NaN"))
     monkeypatch.setattr(app_main, "get_agent", lambda: _StubAgent(bad_reply))
     monkeypatch.setattr(AgentReply, "clipped", lambda self: self)
@@ -408,7 +408,7 @@ def test_invalid_numeric_reply_raises_error(monkeypatch: pytest.MonkeyPatch) ->
 def test_prefixed_chat_ids_trigger_logging(monkeypatch: pytest.MonkeyPatch) -> None:
     """The `/chat` endpoint should log judge requests with the tracked prefix."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     recorder = _RecorderLogger()
     monkeypatch.setattr(app_main, "request_logger", recorder)
     monkeypatch.setattr(request_logging, "request_logger", recorder)
@@ -439,7 +439,7 @@ def test_logger_failures_do_not_block_response(
 ) -> None:
     """Errors raised by the logger should not prevent responding to the judge."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
 
     class _FailingLogger:
         def __init__(self) -> None:
@@ -483,7 +483,7 @@ def test_agent_error_is_logged_with_status(
 ) -> None:
     """Failed agent executions should record an error response with status code."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
     recorder = _RecorderLogger()
     monkeypatch.setattr(app_main, "request_logger", recorder)
     monkeypatch.setattr(request_logging, "request_logger", recorder)
@@ -521,7 +521,7 @@ def test_router_cache_prevents_reclassification(
 ) -> None:
     """Cached routing decisions should bypass the router and reuse the branch."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
 
     router_store = app_main.get_router_decision_store()
     router_store.routes["cached-chat"] = "multi_turn"
@@ -575,7 +575,7 @@ def test_multi_turn_branch_returns_member_key(
 ) -> None:
     """When the router selects multi-turn, the specialised agent should handle the turn."""
 
-    app.dependency_overrides[get_session] = _session_override
+    app.dependency_overrides[get_read_session] = _session_override
 
     router_store = app_main.get_router_decision_store()
     store = _StubTurnStateStore()
@@ -4,28 +4,46 @@ from __future__ import annotations
 
 import asyncio
 from types import SimpleNamespace
+from typing import Iterator
+
+import pytest
 
 from app.agent import AgentDependencies, _fetch_feature_details
+from app.agent.tools import _FEATURE_CACHE
 
 
-class _StubProduct:
-    """Simple container holding fake extra feature metadata."""
+@pytest.fixture(autouse=True)
+def _clear_feature_cache() -> Iterator[None]:
+    """Start every test with an empty feature lookup cache."""
 
-    def __init__(self, extra_features: dict) -> None:
-        self.extra_features = extra_features
+    _FEATURE_CACHE.clear()
+    yield
+    _FEATURE_CACHE.clear()
+
+
+class _StubResult:
+    """Result stub exposing the first column of the first row."""
+
+    def __init__(self, value: object) -> None:
+        self._value = value
+
+    def scalar(self) -> object:
+        return self._value
 
 
 class _StubSession:
-    """Async session stub returning a canned product."""
+    """Async session stub returning canned extra feature metadata."""
 
     def __init__(self, extra_features: dict) -> None:
-        self._product = _StubProduct(extra_features)
+        self._extra_features = extra_features
+        self.statements = []
 
-    async def get(self, *args, **kwargs):
-        return self._product
+    async def get(self, *args, **kwargs):  # pragma: no cover - defensive
+        raise AssertionError("the lookup should use a single query")
 
-    async def execute(self, *args, **kwargs):  # pragma: no cover - defensive
-        raise AssertionError("execute should not be called when get succeeds")
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return _StubResult(self._extra_features)
 
 
 class _StubSessionContext:
@@ -68,6 +86,9 @@ def test_feature_lookup_returns_complete_map() -> None:
         result = await _fetch_feature_details(ctx, " BK-123 ")
 
         assert result.base_random_key == "BK-123"
+        assert len(session.statements) == 1
+        # The case-insensitive fallback only applies when the exact key misses.
+        assert "NOT (EXISTS" in str(session.statements[0])
         assert [feature.name for feature in result.features] == [
             "General Color",
             "General Sizes",
@@ -85,3 +106,23 @@ def test_feature_lookup_returns_complete_map() -> None:
         ]
 
     asyncio.run(_invoke())
+
+
+def test_feature_lookup_reuses_cached_payload() -> None:
+    """Repeated lookups for the same key should not query again."""
+
+    async def _invoke() -> None:
+        session = _StubSession({"Weight": "10 kg"})
+        ctx = SimpleNamespace(
+            deps=AgentDependencies(
+                session=session, session_factory=_StubSessionFactory(session)
+            )
+        )
+
+        first = await _fetch_feature_details(ctx, "BK-9")
+        second = await _fetch_feature_details(ctx, " BK-9 ")
+
+        assert second is first
+        assert len(session.statements) == 1
+
+    asyncio.run(_invoke())
@@ -4,8 +4,26 @@ from __future__ import annotations
 
 import asyncio
 from types import SimpleNamespace
+from typing import Iterator
 
-from app.agent.multiturn.tools import SearchMembersResult, _search_members
+import pytest
+
+from app.agent.multiturn.tools import (
+    _SEARCH_CACHE,
+    SearchMembersResult,
+    _SearchShape,
+    _search_members,
+    _search_members_statement,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_search_cache() -> Iterator[None]:
+    """Start every test with an empty search_members cache."""
+
+    _SEARCH_CACHE.clear()
+    yield
+    _SEARCH_CACHE.clear()
 
 
 class _RecordingSession:
@@ -16,35 +34,70 @@ class _RecordingSession:
 
     async def execute(self, stmt, params):  # pragma: no cover - simple stub
         self.calls.append({"stmt": stmt, "params": params})
-        assert params["priority_tokens_json"] == ["لوستر سقفی"]
-        assert params["generic_tokens_json"] == ["اتاق نشیمن"]
+        assert params["priority_tokens"] == ["لوستر سقفی"]
+        assert params["generic_tokens"] == ["اتاق نشیمن"]
+        assert params["priority_phrases"] == ['"لوستر سقفی"']
+        assert params["generic_phrases"] == ['"اتاق نشیمن"']
         assert params["priority_any_query_text"] == '"لوستر سقفی"'
         assert params["generic_any_query_text"] == '"اتاق نشیمن"'
-        assert params["has_priority_query"] is True
-        assert params["has_generic_query"] is True
-        assert params["has_priority_any_query"] is True
-        assert params["has_generic_any_query"] is True
+        assert "has_priority_query" not in params
         assert params["priority_weight"] == 2.0
         assert params["generic_weight"] == 1.0
         assert params["brand_name_query"] is None
         assert params["category_name_query"] is None
         assert params["city_name_query"] is None
+        assert params["match_query_text"] == "لوستر OR سقفی OR اتاق OR نشیمن"
+        assert params["match_name_tokens"] == ["لوستر سقفی", "اتاق نشیمن"]
         sql_text = str(stmt)
         assert "priority_weight" in sql_text
         assert "generic_weight" in sql_text
         assert "0.105" in sql_text
         assert "0.195" in sql_text
-        return _StubResult({"count": 0, "topK": [], "distributions": {}})
+        assert "IN (SELECT random_key FROM matched_products)" in sql_text
+        # Every token keeps its own trigram test instead of one joined string.
+        assert "unnest(:match_name_tokens) AS name_tokens(token)" in sql_text
+        assert "bp.persian_name % name_tokens.token" in sql_text
+        assert "bp.english_name % name_tokens.token" in sql_text
+        assert "%>" not in sql_text
+        return _StubResult([_group_row(15, 0)])
+
+
+_ROW_COLUMNS = (
+    "grouping_mask",
+    "brand_id",
+    "city_id",
+    "has_warranty",
+    "price_bucket",
+    "freq",
+    "min_price",
+    "max_price",
+    "member_random_key",
+    "base_name",
+    "brand_name",
+    "price",
+    "shop_id",
+    "shop_score",
+    "city_name",
+    "relevance",
+)
+
+
+def _group_row(mask, freq, **columns):
+    """Return one grouping-set row as emitted by the search statement."""
+
+    row = dict.fromkeys(_ROW_COLUMNS)
+    row.update(grouping_mask=mask, freq=freq, **columns)
+    return row
 
 
 class _StubResult:
     """Provide the minimal interface consumed by _search_members."""
 
-    def __init__(self, payload):
-        self._payload = payload
+    def __init__(self, rows):
+        self._rows = rows
 
-    def one(self):
-        return SimpleNamespace(_mapping={"payload": self._payload})
+    def mappings(self):
+        return iter(self._rows)
 
 
 def test_search_members_accepts_multiple_query_tokens() -> None:
@@ -64,3 +117,184 @@ def test_search_members_accepts_multiple_query_tokens() -> None:
     assert isinstance(result, SearchMembersResult)
     assert result.count == 0
     assert session.calls, "Expected the stub session to record the execution"
+
+
+class _RowsSession:
+    """Return canned rows regardless of the statement."""
+
+    def __init__(self, rows) -> None:
+        self._rows = rows
+        self.calls = 0
+
+    async def execute(self, stmt, params):  # pragma: no cover - simple stub
+        self.calls += 1
+        return _StubResult(self._rows)
+
+
+def test_search_members_partitions_grouping_sets() -> None:
+    """Grouping-set rows should split into the count and sorted distributions."""
+
+    candidate = dict.fromkeys(_ROW_COLUMNS)
+    candidate.update(
+        member_random_key="m-1",
+        base_name="یخچال",
+        price=1500,
+        shop_id=3,
+        shop_score=5.0,
+        city_name="تهران",
+        relevance=0.4,
+    )
+    rows = [_group_row(15, 42, min_price=1000, max_price=1010)]
+    rows += [_group_row(7, brand_id, brand_id=brand_id) for brand_id in range(1, 13)]
+    rows += [_group_row(7, 5), _group_row(13, 30, has_warranty=True)]
+    rows += [_group_row(13, 12, has_warranty=False), _group_row(11, 42, city_id=7)]
+    rows += [
+        _group_row(14, 2, price_bucket=4),
+        _group_row(14, 40, price_bucket=1),
+        _group_row(14, 1, price_bucket=5),
+    ]
+    rows.append(candidate)
+    session = _RowsSession(rows)
+    ctx = SimpleNamespace(deps=SimpleNamespace(session=session))
+
+    result = asyncio.run(_search_members(ctx, priority_query_tokens=["یخچال"]))
+
+    assert result.count == 42
+    assert [item.member_random_key for item in result.topK] == ["m-1"]
+    assert result.topK[0].shop_name == "فروشگاه 3"
+    assert result.topK[0].shop_score == 5.0
+    brand = result.distributions.brand
+    assert brand is not None
+    assert len(brand) == 10
+    assert brand[0] == (12, 12)
+    assert (None, 5) in brand
+    assert result.distributions.warranty == [(True, 30), (False, 12)]
+    assert result.distributions.city == [(7, 42)]
+    assert result.distributions.price_band == [
+        ("≤ 1003", 40),
+        ("≥ 1008", 2),
+        ("1010–1013", 1),
+    ]
+
+
+def test_search_members_reuses_cached_results() -> None:
+    """Identical normalised arguments should be answered from the cache."""
+
+    session = _RowsSession([_group_row(15, 3)])
+    ctx = SimpleNamespace(deps=SimpleNamespace(session=session))
+
+    first = asyncio.run(_search_members(ctx, generic_query_tokens=["میز"], brand_id=4))
+    second = asyncio.run(
+        _search_members(ctx, generic_query_tokens=[" میز ", ""], brand_id=4)
+    )
+    asyncio.run(_search_members(ctx, generic_query_tokens=["میز"], brand_id=5))
+
+    assert second is first
+    assert second.count == 3
+    assert session.calls == 2
+
+
+def test_search_members_statement_is_specialised_per_filter_shape() -> None:
+    """Only the hard filters and scoring terms that apply should reach the SQL."""
+
+    shape = _SearchShape(
+        has_brand_id=True,
+        city_filter="id",
+        has_price_max=True,
+        has_priority_tokens=True,
+    )
+    statement = _search_members_statement(shape)
+    sql_text = str(statement)
+
+    assert "bp.brand_id = :brand_id" in sql_text
+    assert "s.city_id = :city_id" in sql_text
+    assert "m.price <= :price_max" in sql_text
+    assert ":category_id" not in sql_text
+    assert ":price_min" not in sql_text
+    assert ":brand_id IS NULL" not in sql_text
+    assert "shop_score DESC NULLS LAST" in sql_text
+    assert "priority_token_stats" in sql_text
+    assert "product_scores AS MATERIALIZED" in sql_text
+    assert "shop_score::float8" in sql_text
+    assert "generic_token_stats" not in sql_text
+    assert ":generic_weight" not in sql_text
+    assert sql_text.count("websearch_to_tsquery('simple', :priority_query_text)") == 1
+    assert statement is _search_members_statement(shape)
+
+
+
+def test_search_members_prefilter_still_scores_sub_threshold_products() -> None:
+    """Products outside matched_products must stay rankable when needed.
+
+    A weak or misspelt query can leave fewer than ``limit`` matched members
+    above the similarity bound; the remaining products are then scored too, so
+    the topK matches what scoring every row would return.
+    """
+
+    sql_text = str(
+        _search_members_statement(
+            _SearchShape(has_priority_tokens=True, prefilter=True)
+        )
+    )
+
+    assert "matched_scores AS MATERIALIZED" in sql_text
+    assert "AND bp.random_key IN (SELECT random_key FROM matched_products)" in sql_text
+    assert "SELECT COUNT(*) >= :limit AS sufficient" in sql_text
+    assert "current_setting('pg_trgm.similarity_threshold', TRUE)" in sql_text
+    assert (
+        "AND bp.random_key NOT IN (SELECT random_key FROM matched_products)\n"
+        "          AND NOT (SELECT sufficient FROM prefilter_check)"
+    ) in sql_text
+    assert "FROM matched_scores\n        UNION ALL" in sql_text
+    assert "JOIN product_scores AS ps ON ps.random_key = f.base_random_key" in sql_text
+
+def test_search_members_statement_skips_scoring_without_query_inputs() -> None:
+    """Pure filter browsing cannot rank anything, so no scoring SQL is emitted."""
+
+    sql_text = str(_search_members_statement(_SearchShape(has_category_id=True)))
+
+    assert "scored AS" not in sql_text
+    assert "_token_stats" not in sql_text
+    assert "top_candidates" not in sql_text
+
+
+def test_search_members_statement_scores_names_per_lookup_row() -> None:
+    """Name similarities should be computed on the lookup tables, not per member."""
+
+    sql_text = str(
+        _search_members_statement(
+            _SearchShape(has_brand_name=True, city_filter="name")
+        )
+    )
+
+    assert "brand_scores AS MATERIALIZED" in sql_text
+    assert "city_scores AS MATERIALIZED" in sql_text
+    assert "category_scores" not in sql_text
+    assert "similarity(COALESCE(f." not in sql_text
+
+
+def test_search_members_short_circuits_without_inputs() -> None:
+    """A call with no tokens, names or filters should not touch the database."""
+
+    session = _RowsSession([_group_row(15, 99)])
+    ctx = SimpleNamespace(deps=SimpleNamespace(session=session))
+
+    result = asyncio.run(
+        _search_members(ctx, priority_query_tokens=[" "], brand_name="  ")
+    )
+
+    assert result.count == 0
+    assert result.topK == []
+    assert session.calls == 0
+
+
+def test_search_members_statement_can_skip_distributions() -> None:
+    """Without distributions only the total row should be aggregated."""
+
+    shape = _SearchShape(has_priority_tokens=True, include_distributions=False)
+    sql_text = str(_search_members_statement(shape))
+
+    assert "GROUPING SETS" not in sql_text
+    assert "price_bounds" not in sql_text
+    assert "totals AS" in sql_text
+    assert "FROM top_candidates" in sql_text
@@ -3,13 +3,22 @@
 from __future__ import annotations
 
 from types import SimpleNamespace
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 
 import anyio
 import pytest
 
 from app.agent import AgentDependencies
-from app.agent.tools import _search_base_products
+from app.agent.tools import _PRODUCT_SEARCH_CACHE, _search_base_products
+
+
+@pytest.fixture(autouse=True)
+def _clear_product_search_cache() -> Iterator[None]:
+    """Start every test with an empty product search cache."""
+
+    _PRODUCT_SEARCH_CACHE.clear()
+    yield
+    _PRODUCT_SEARCH_CACHE.clear()
 
 
 class _RecordingSession:
@@ -84,3 +93,26 @@ async def test_search_base_products_allows_parallel_calls() -> None:
 
     assert factory.calls == 2
     assert {label for label, _ in factory.log} == {"session-1", "session-2"}
+    # The key lookup and the fuzzy search share a single statement.
+    assert sorted(factory.log) == [
+        ("session-1", "execute"),
+        ("session-2", "execute"),
+    ]
+
+
+@pytest.mark.anyio("asyncio")
+async def test_search_base_products_reuses_cached_results() -> None:
+    """Repeating a query should be answered without another session."""
+
+    factory = _RecordingSessionFactory()
+    deps = AgentDependencies(
+        session=_RecordingSession("legacy", factory.log),
+        session_factory=factory,
+    )
+    ctx = SimpleNamespace(deps=deps)
+
+    first = await _search_base_products(ctx, "cached query")
+    second = await _search_base_products(ctx, "  cached query ")
+
+    assert second is first
+    assert factory.calls == 1
@@ -0,0 +1,64 @@
+"""Unit tests for the seller statistics aggregation helper."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from app.agent.tools import _collect_seller_statistics
+
+
+class _StubSession:
+    """Async session stub returning canned offer rows."""
+
+    def __init__(self, rows: list[tuple]) -> None:
+        self._rows = rows
+
+    async def execute(self, *args, **kwargs):
+        return iter(self._rows)
+
+
+class _StubSessionContext:
+    """Context manager returning the provided stub session."""
+
+    def __init__(self, session: _StubSession) -> None:
+        self._session = session
+
+    async def __aenter__(self) -> _StubSession:
+        return self._session
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+def test_seller_statistics_rolls_up_per_city() -> None:
+    """Offers should aggregate globally and per city."""
+
+    rows = [
+        (1, 1000, True, 4.5, 10, "تهران"),
+        (2, 3000, False, 3.5, 10, "تهران"),
+        (3, 2000, True, None, 20, "شیراز"),
+    ]
+    session = _StubSession(rows)
+    ctx = SimpleNamespace(
+        deps=SimpleNamespace(session_factory=lambda: _StubSessionContext(session))
+    )
+
+    result = asyncio.run(_collect_seller_statistics(ctx, " BK-1 ", city="تهران"))
+
+    assert result.base_random_key == "BK-1"
+    assert result.total_offers == 3
+    assert result.distinct_shops == 3
+    assert result.shops_with_warranty == 2
+    assert result.min_price == 1000
+    assert result.max_price == 3000
+    assert result.average_score == 4.0
+    assert result.num_cities_with_offers == 2
+    assert len(result.city_stats) == 1
+
+    tehran = result.city_stats[0]
+    assert tehran.city_id == 10
+    assert tehran.offer_count == 2
+    assert tehran.distinct_shops == 2
+    assert tehran.shops_without_warranty == 1
+    assert tehran.average_price == 2000
@@ -0,0 +1,147 @@
+"""Unit tests for the in-process TTL cache."""
+
+from __future__ import annotations
+
+import asyncio
+
+from app.agent.cache import TTLCache
+
+
+class _Clock:
+    """Manually advanced clock used to control expiry."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used() -> None:
+    """Entries should expire after the TTL and respect the size bound."""
+
+    clock = _Clock()
+    cache: TTLCache[str] = TTLCache(maxsize=2, ttl=10, timer=clock)
+
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert len(cache) == 2
+
+    clock.now = 10.0
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_coalesces_concurrent_loads() -> None:
+    """Concurrent misses for one key should share a single loader call."""
+
+    async def _invoke() -> None:
+        cache: TTLCache[int] = TTLCache(maxsize=4, ttl=60)
+        calls = 0
+
+        async def _loader() -> int:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            return 7
+
+        results = await asyncio.gather(
+            *(cache.get_or_load("key", _loader) for _ in range(3))
+        )
+        assert results == [7, 7, 7]
+        assert calls == 1
+        assert await cache.get_or_load("key", _loader) == 7
+        assert calls == 1
+
+    asyncio.run(_invoke())
+
+
+def test_ttl_cache_does_not_store_failed_loads() -> None:
+    """A failing loader should propagate its error and leave the key empty."""
+
+    async def _invoke() -> None:
+        cache: TTLCache[int] = TTLCache(maxsize=4, ttl=60)
+
+        async def _failing() -> int:
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        outcomes = await asyncio.gather(
+            cache.get_or_load("key", _failing),
+            cache.get_or_load("key", _failing),
+            return_exceptions=True,
+        )
+        assert all(isinstance(item, RuntimeError) for item in outcomes)
+        assert cache.get("key") is None
+
+        async def _succeeding() -> int:
+            return 3
+
+        assert await cache.get_or_load("key", _succeeding) == 3
+
+    asyncio.run(_invoke())
+
+
+def test_ttl_cache_waiters_survive_cancelled_loader() -> None:
+    """Cancelling the loading caller should not cancel coalesced waiters."""
+
+    async def _invoke() -> None:
+        cache: TTLCache[int] = TTLCache(maxsize=4, ttl=60)
+        started = asyncio.Event()
+        calls = 0
+
+        async def _loader() -> int:
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.01)
+            return 5
+
+        loading = asyncio.create_task(cache.get_or_load("key", _loader))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_load("key", _loader))
+        await asyncio.sleep(0)
+
+        loading.cancel()
+        outcomes = await asyncio.gather(loading, waiter, return_exceptions=True)
+
+        assert isinstance(outcomes[0], asyncio.CancelledError)
+        assert outcomes[1] == 5
+        assert not waiter.cancelled()
+        assert calls == 2
+        assert cache.get("key") == 5
+
+    asyncio.run(_invoke())
+
+
+def test_ttl_cache_cancelled_waiter_leaves_load_running() -> None:
+    """Cancelling a waiter should not disturb the caller running the load."""
+
+    async def _invoke() -> None:
+        cache: TTLCache[int] = TTLCache(maxsize=4, ttl=60)
+        started = asyncio.Event()
+
+        async def _loader() -> int:
+            started.set()
+            await asyncio.sleep(0.01)
+            return 9
+
+        loading = asyncio.create_task(cache.get_or_load("key", _loader))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_load("key", _loader))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        outcomes = await asyncio.gather(loading, waiter, return_exceptions=True)
+
+        assert outcomes[0] == 9
+        assert isinstance(outcomes[1], asyncio.CancelledError)
+        assert cache.get("key") == 9
+
+    asyncio.run(_invoke())
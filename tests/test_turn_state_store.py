@@ -0,0 +1,41 @@
+"""Unit tests for the in-memory multi-turn state store."""
+
+from __future__ import annotations
+
+import asyncio
+
+from app.agent.multiturn.schemas import TurnFilters, TurnState
+from app.agent.multiturn.state import TurnStateStore
+
+
+def test_store_isolates_snapshots_from_callers() -> None:
+    """Mutating a stored or returned state must not leak into the store."""
+
+    async def _invoke() -> None:
+        store = TurnStateStore()
+        state = TurnState(
+            turn=2,
+            filters=TurnFilters(brand_name="سامسونگ", price_max=2_000_000),
+            priority_query_tokens=["یخچال"],
+        )
+
+        await store.set("chat-1", state)
+        state.priority_query_tokens.append("فریزر")
+        state.filters.price_max = 1
+
+        loaded = await store.get("chat-1")
+        assert loaded is not None
+        assert loaded.turn == 2
+        assert loaded.filters.brand_name == "سامسونگ"
+        assert loaded.filters.price_max == 2_000_000
+        assert loaded.priority_query_tokens == ["یخچال"]
+
+        loaded.asked_fields.append("product_overview")
+        reloaded = await store.get("chat-1")
+        assert reloaded is not None
+        assert reloaded.asked_fields == []
+
+        await store.discard("chat-1")
+        assert await store.get("chat-1") is None
+
+    asyncio.run(_invoke())